@@ -1,15 +1,241 @@
+import ast
+import io
 import json
 import os
+import shutil
+import sqlite3
+import struct
+import sys
 import numpy as np
 import hashlib
-from typing import Dict, List, Optional
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import liburing  # optional, Linux-only io_uring bindings
+except ImportError:
+    liburing = None
+
+try:
+    import orjson  # optional, 2-5x faster than stdlib json
+except ImportError:
+    orjson = None
+
+
+def _json_loads(data: bytes) -> Dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj: Dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _encode_log_record(image_path: str, filename: Optional[str]) -> bytes:
+    """One manifest-log record: u32 path_len | u32 name_len | path | name.
+
+    An empty name marks a tombstone (the path was removed).
+    """
+    p = image_path.encode('utf-8')
+    n = filename.encode('utf-8') if filename else b""
+    return struct.pack('<II', len(p), len(n)) + p + n
+
+_NPY_MAGIC = b"\x93NUMPY"
+
+# Below this many files the submission setup outweighs the saved syscalls.
+_IO_URING_MIN_FILES = 256
+_IO_URING_QUEUE_DEPTH = 256
+
+
+def _io_uring_available() -> bool:
+    return sys.platform == 'linux' and liburing is not None
+
+
+# Filenames only need to be unique per path, not cryptographic; prefer a
+# SIMD hash when one is installed. 64 bits (16 hex chars) is plenty for
+# collision-free naming on realistic collection sizes. Old caches keep
+# working: lookups go through the manifest, which stores the filename.
+try:
+    import xxhash
+
+    def _hash_path(image_path: str) -> str:
+        return xxhash.xxh3_128(image_path.encode()).hexdigest()[:16]
+except ImportError:
+    try:
+        from blake3 import blake3
+
+        def _hash_path(image_path: str) -> str:
+            return blake3(image_path.encode()).hexdigest()[:16]
+    except ImportError:
+        def _hash_path(image_path: str) -> str:
+            return hashlib.md5(image_path.encode()).hexdigest()
+
+
+def _fast_load_npy(path: str) -> np.ndarray:
+    """Minimal .npy reader for the plain arrays this cache writes.
+
+    np.load re-parses the header through the generic format machinery on
+    every call; for 2 KB embedding vectors that overhead dominates. Read
+    the magic, header length and header dict directly, then np.fromfile
+    the payload in one shot. Falls back to np.load on anything
+    unexpected (pickled objects, fortran order, foreign files).
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(_NPY_MAGIC))
+        if magic != _NPY_MAGIC:
+            raise ValueError(f"not a .npy file: {path}")
+
+        major, _minor = f.read(2)
+        if major == 1:
+            header_len = int.from_bytes(f.read(2), 'little')
+        else:
+            header_len = int.from_bytes(f.read(4), 'little')
+
+        header = ast.literal_eval(f.read(header_len).decode('latin1'))
+        if header.get('fortran_order'):
+            raise ValueError(f"fortran-ordered array: {path}")
+
+        shape = header['shape']
+        count = 1
+        for dim in shape:
+            count *= dim
+        data = np.fromfile(f, dtype=np.dtype(header['descr']), count=count)
+
+    return data.reshape(shape)
+
+
+def _load_npy(path: str) -> np.ndarray:
+    try:
+        return _fast_load_npy(path)
+    except Exception:
+        return np.load(path)
+
+
+_npy_header_cache: Dict[tuple, bytes] = {}
+
+
+def _fast_save_npy(path: str, arr: np.ndarray):
+    """Write a .npy file as one write() call with a cached header.
+
+    np.save re-derives the header and probes the pickle path on every
+    call; all embeddings share one dtype/shape, so build the header once
+    and emit header+payload in a single buffer.
+    """
+    arr = np.ascontiguousarray(arr)
+    key = (arr.dtype.str, arr.shape)
+    header = _npy_header_cache.get(key)
+    if header is None:
+        buf = io.BytesIO()
+        np.lib.format.write_array_header_1_0(buf, {
+            'descr': arr.dtype.str,
+            'fortran_order': False,
+            'shape': arr.shape,
+        })
+        header = buf.getvalue()
+        _npy_header_cache[key] = header
+
+    with open(path, 'wb') as f:
+        f.write(header + arr.tobytes())
+
+
+def _normalize(embedding: np.ndarray) -> np.ndarray:
+    v = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    if norm > 0:
+        v = v / norm
+    return v
+
+
+class PackedEmbeddingStore:
+    """All embeddings as one contiguous float32 matrix on disk.
+
+    Rows live in embeddings.f32, one image path per row in the
+    embeddings.ids sidecar (same order). Appends are O(row); reads map
+    the whole matrix lazily with np.memmap instead of opening N files.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.matrix_path = os.path.join(store_dir, "embeddings.f32")
+        self.ids_path = os.path.join(store_dir, "embeddings.ids")
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _load_ids(self) -> List[str]:
+        if not os.path.exists(self.ids_path):
+            return []
+        with open(self.ids_path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def append(self, image_path: str, vec: np.ndarray):
+        row = np.ascontiguousarray(vec, dtype=np.float32).reshape(-1)
+        with open(self.matrix_path, 'ab') as f:
+            f.write(row.tobytes())
+        with open(self.ids_path, 'a', encoding='utf-8') as f:
+            f.write(image_path + "\n")
+
+    def load_matrix(self) -> Tuple[List[str], Optional[np.ndarray]]:
+        ids = self._load_ids()
+        if not ids:
+            if os.path.exists(self.matrix_path):
+                self.clear()  # rows without ids are unaddressable
+            return [], None
+        if not os.path.exists(self.matrix_path):
+            self.clear()
+            return [], None
+
+        size = os.path.getsize(self.matrix_path)
+        dim = size // (4 * len(ids))
+        if dim == 0 or size != len(ids) * dim * 4:
+            # Matrix and sidecar disagree (torn append from a crash
+            # mid-write). Returning empty without repairing would make
+            # every later load fail too — and each backfill append onto
+            # the torn tail would corrupt the files further. The
+            # per-file blobs are the durable record, so reset both
+            # files and let the caller's backfill repopulate them.
+            self.clear()
+            return [], None
+
+        matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(len(ids), dim))
+        return ids, matrix
+
+    def clear(self):
+        for path in (self.matrix_path, self.ids_path):
+            if os.path.exists(path):
+                os.remove(path)
 
 
 class CacheManager:
+    """Embedding cache for one model at a time.
+
+    Storage invariants: vectors are L2-normalized before persisting, so
+    cosine similarity downstream is a plain dot product. Per-file .npy
+    blobs are float16 (the scan and the disk are bandwidth-bound; half
+    the bytes, same retrieval quality) and every load path upcasts to
+    float32. The packed matrix keeps float32 rows so memmap consumers
+    see one BLAS-friendly dtype.
+    """
+
+    # Bump when on-disk invariants change; _migrate_schema upgrades
+    # older caches in place. Version 2 = vectors normalized at write.
+    SCHEMA_VERSION = 2
+
     def __init__(self, cache_dir: str = "cache", model_name: str = "clip-vit-base-patch32"):
         self.cache_dir = cache_dir
         self.base_cache_dir = cache_dir
         self.model_name = model_name
+        self._manifest_cache: Optional[Dict] = None
+        self._manifest_mtime: int = -1
+        self._log_size: int = -1
+        self._log_records: int = 0
+        # Thumbnails depend only on the source image, not the model.
+        self.thumbs_dir = os.path.join(self.base_cache_dir, "thumbs")
+        # Small sqlite sidecar (text-query embeddings, file freshness
+        # stats); one database serves all models. Opened lazily.
+        self._meta_db = None
         self._migrate_if_needed()
         self._set_model_dir()
 
@@ -35,7 +261,72 @@ class CacheManager:
         self.model_cache_dir = os.path.join(self.base_cache_dir, self.model_name)
         self.embeddings_dir = os.path.join(self.model_cache_dir, "embeddings")
         self.manifest_path = os.path.join(self.model_cache_dir, "manifest.json")
+        self.manifest_log_path = os.path.join(self.model_cache_dir, "manifest.log")
         os.makedirs(self.embeddings_dir, exist_ok=True)
+        self.packed_store = PackedEmbeddingStore(self.model_cache_dir)
+        self._shard_dirs_made = set()
+        self._invalidate_manifest_cache()
+        self._shard_if_needed()
+        self._migrate_schema()
+
+    def _migrate_schema(self):
+        """One-shot upgrade of caches written before normalize-at-save.
+
+        Renormalizes every per-file blob in place, then stamps the
+        schema version so later startups skip the walk entirely.
+        """
+        version_path = os.path.join(self.model_cache_dir, "schema_version")
+        try:
+            with open(version_path, 'r', encoding='utf-8') as f:
+                version = int(f.read().strip())
+        except (OSError, ValueError):
+            version = 1
+
+        if version < 2:
+            for filename in self._load_manifest().values():
+                emb_path = os.path.join(self.embeddings_dir, filename)
+                try:
+                    v = _normalize(_load_npy(emb_path).astype(np.float32, copy=False))
+                    _fast_save_npy(emb_path, v.astype(np.float16))
+                except Exception:
+                    continue  # unreadable blob; load_embedding will cope
+
+        with open(version_path, 'w', encoding='utf-8') as f:
+            f.write(str(self.SCHEMA_VERSION))
+
+    def _shard_if_needed(self):
+        """Move flat .npy files into 256 two-hex-char shard subdirs.
+
+        Directories with 100k+ entries slow every open/stat on common
+        filesystems; bounded shards keep lookups O(1). Manifest values
+        are rewritten to the sharded relative paths in one save.
+        """
+        flat = [e.name for e in os.scandir(self.embeddings_dir)
+                if e.is_file() and e.name.endswith('.npy')]
+        if not flat:
+            return
+        for name in flat:
+            shard_dir = os.path.join(self.embeddings_dir, name[:2])
+            os.makedirs(shard_dir, exist_ok=True)
+            os.replace(os.path.join(self.embeddings_dir, name),
+                       os.path.join(shard_dir, name))
+        manifest = {
+            p: (fn if '/' in fn else f"{fn[:2]}/{fn}")
+            for p, fn in self._load_manifest().items()
+        }
+        self._save_manifest(manifest)
+
+    def _ensure_shard_dir(self, filename: str):
+        shard = os.path.dirname(filename)
+        if shard and shard not in self._shard_dirs_made:
+            os.makedirs(os.path.join(self.embeddings_dir, shard), exist_ok=True)
+            self._shard_dirs_made.add(shard)
+
+    def _invalidate_manifest_cache(self):
+        self._manifest_cache = None
+        self._manifest_mtime = -1
+        self._log_size = -1
+        self._log_records = 0
 
     def set_model(self, model_name: str):
         if model_name != self.model_name:
@@ -43,18 +334,107 @@ class CacheManager:
             self._set_model_dir()
 
     def _get_embedding_filename(self, image_path: str) -> str:
-        path_hash = hashlib.md5(image_path.encode()).hexdigest()
-        return f"{path_hash}.npy"
+        # Reuse the name already recorded for this path (avoids both a
+        # rehash and orphaning the old file under a different scheme).
+        manifest = self._load_manifest()
+        existing = manifest.get(image_path)
+        if existing is not None:
+            return existing
+        path_hash = _hash_path(image_path)
+        return f"{path_hash[:2]}/{path_hash}.npy"
 
     def _load_manifest(self) -> Dict:
-        if os.path.exists(self.manifest_path):
-            with open(self.manifest_path, 'r') as f:
-                return json.load(f)
-        return {}
+        """Manifest state = manifest.json snapshot + manifest.log replay.
+
+        Single-entry updates append one record to the log instead of
+        rewriting the whole snapshot (O(1) bytes per save instead of
+        O(N)). The merged dict is cached and only rebuilt when either
+        file changes on disk.
+        """
+        try:
+            snap_mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            snap_mtime = -1
+        try:
+            log_size = os.path.getsize(self.manifest_log_path)
+        except OSError:
+            log_size = 0
+
+        if (self._manifest_cache is not None
+                and snap_mtime == self._manifest_mtime
+                and log_size == self._log_size):
+            return self._manifest_cache
+
+        if snap_mtime != -1:
+            with open(self.manifest_path, 'rb') as f:
+                manifest = _json_loads(f.read())
+        else:
+            manifest = {}
+
+        self._log_records = self._replay_log(manifest) if log_size else 0
+        self._manifest_cache = manifest
+        self._manifest_mtime = snap_mtime
+        self._log_size = log_size
+
+        if self._should_compact():
+            self._save_manifest(manifest)
+        return self._manifest_cache
+
+    def _replay_log(self, manifest: Dict) -> int:
+        with open(self.manifest_log_path, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        records = 0
+        while offset + 8 <= len(data):
+            path_len, name_len = struct.unpack_from('<II', data, offset)
+            if offset + 8 + path_len + name_len > len(data):
+                break  # torn tail write; ignore the partial record
+            offset += 8
+            img_path = data[offset:offset + path_len].decode('utf-8')
+            offset += path_len
+            filename = data[offset:offset + name_len].decode('utf-8')
+            offset += name_len
+            if filename:
+                manifest[img_path] = filename
+            else:
+                manifest.pop(img_path, None)
+            records += 1
+        return records
+
+    def _should_compact(self) -> bool:
+        live = len(self._manifest_cache) if self._manifest_cache else 1
+        return self._log_records >= 64 and self._log_records > 2 * live
+
+    def _append_manifest_entry(self, image_path: str, filename: Optional[str]):
+        manifest = self._load_manifest()
+        if filename:
+            manifest[image_path] = filename
+        else:
+            manifest.pop(image_path, None)
+
+        record = _encode_log_record(image_path, filename)
+        with open(self.manifest_log_path, 'ab') as f:
+            f.write(record)
+        self._log_size = max(self._log_size, 0) + len(record)
+        self._log_records += 1
+
+        if self._should_compact():
+            self._save_manifest(manifest)
 
     def _save_manifest(self, manifest: Dict):
-        with open(self.manifest_path, 'w') as f:
-            json.dump(manifest, f, indent=2)
+        # Full checkpoint: write-then-rename the snapshot (a crash
+        # mid-save never corrupts it), then drop the log it subsumes.
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_json_dumps(manifest))
+        os.replace(tmp_path, self.manifest_path)
+        if os.path.exists(self.manifest_log_path):
+            os.remove(self.manifest_log_path)
+        self._manifest_cache = manifest
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+        self._log_size = 0
+        self._log_records = 0
 
     def get_embedding_path(self, image_path: str) -> Optional[str]:
         manifest = self._load_manifest()
@@ -68,68 +448,382 @@ class CacheManager:
         return self.get_embedding_path(image_path) is not None
 
     def save_embedding(self, image_path: str, embedding: np.ndarray):
-        manifest = self._load_manifest()
-        
         filename = self._get_embedding_filename(image_path)
+        self._ensure_shard_dir(filename)
         emb_path = os.path.join(self.embeddings_dir, filename)
-        
-        np.save(emb_path, embedding)
-        
-        manifest[image_path] = filename
+
+        # Downstream use is cosine similarity on normalized vectors, so
+        # fp16 on disk loses nothing measurable and halves cache IO.
+        v = _normalize(embedding)
+        _fast_save_npy(emb_path, v.astype(np.float16))
+        self.packed_store.append(image_path, v)
+
+        self._append_manifest_entry(image_path, filename)
+        self._record_stats([image_path])
+
+    def save_embeddings_bulk(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        manifest = dict(self._load_manifest())
+
+        for image_path, embedding in items.items():
+            filename = self._get_embedding_filename(image_path)
+            self._ensure_shard_dir(filename)
+            emb_path = os.path.join(self.embeddings_dir, filename)
+            v = _normalize(embedding)
+            _fast_save_npy(emb_path, v.astype(np.float16))
+            self.packed_store.append(image_path, v)
+            manifest[image_path] = filename
+
         self._save_manifest(manifest)
+        self._record_stats(list(items.keys()))
 
     def load_embedding(self, image_path: str) -> Optional[np.ndarray]:
         emb_path = self.get_embedding_path(image_path)
         if emb_path:
-            return np.load(emb_path)
+            return _load_npy(emb_path).astype(np.float32, copy=False)
         return None
 
+    def _read_all_io_uring(self, manifest: Dict) -> Dict[str, np.ndarray]:
+        """Bulk-read every embedding with one io_uring submission batch.
+
+        All files share the same dtype/shape, so the .npy header size is
+        constant: probe it from the first file, then queue one read per
+        file straight into a row of a preallocated matrix, submitting in
+        batches of _IO_URING_QUEUE_DEPTH. Files that do not match the
+        expected size are re-read through the normal path by the caller.
+        """
+        items = list(manifest.items())
+        first = _load_npy(os.path.join(self.embeddings_dir, items[0][1]))
+        header_size = os.path.getsize(os.path.join(self.embeddings_dir, items[0][1])) - first.nbytes
+        expected_size = header_size + first.nbytes
+
+        out = np.empty((len(items), first.size), dtype=first.dtype)
+        embeddings = {}
+
+        row_bytes = first.nbytes
+
+        ring = liburing.io_uring()
+        liburing.io_uring_queue_init(_IO_URING_QUEUE_DEPTH, ring, 0)
+        try:
+            cqe = liburing.io_uring_cqe()
+            # Each entry keeps its iovec referenced until the completion
+            # is reaped: the kernel reads the iovec at submit time, and
+            # letting it go out of scope before then would hand the
+            # kernel a dangling pointer.
+            pending = []
+            complete_rows = set()
+
+            def _reap():
+                for _ in range(len(pending)):
+                    liburing.io_uring_wait_cqe(ring, cqe)
+                    # res is the byte count (or -errno); a short or
+                    # failed read must not surface the uninitialized
+                    # buffer row as an embedding.
+                    if cqe.res == row_bytes:
+                        complete_rows.add(cqe.user_data)
+                    liburing.io_uring_cqe_seen(ring, cqe)
+                for fd, img_path, row, _iov, emb_path in pending:
+                    os.close(fd)
+                    if row in complete_rows:
+                        embeddings[img_path] = out[row].astype(np.float32)
+                    else:
+                        try:
+                            embeddings[img_path] = _load_npy(emb_path).astype(
+                                np.float32, copy=False)
+                        except (OSError, ValueError):
+                            pass  # unreadable either way; drop the entry
+                pending.clear()
+                complete_rows.clear()
+
+            for row, (img_path, filename) in enumerate(items):
+                emb_path = os.path.join(self.embeddings_dir, filename)
+                try:
+                    fd = os.open(emb_path, os.O_RDONLY)
+                except OSError:
+                    continue
+                if os.fstat(fd).st_size != expected_size:
+                    os.close(fd)
+                    embeddings[img_path] = _load_npy(emb_path).astype(
+                        np.float32, copy=False)
+                    continue
+
+                sqe = liburing.io_uring_get_sqe(ring)
+                iov = liburing.iovec(out[row].data.cast('B'))
+                liburing.io_uring_prep_readv(sqe, fd, iov, 1, header_size)
+                liburing.io_uring_sqe_set_data64(sqe, row)
+                pending.append((fd, img_path, row, iov, emb_path))
+
+                if len(pending) >= _IO_URING_QUEUE_DEPTH:
+                    liburing.io_uring_submit(ring)
+                    _reap()
+
+            if pending:
+                liburing.io_uring_submit(ring)
+                _reap()
+        finally:
+            liburing.io_uring_queue_exit(ring)
+
+        return embeddings
+
     def get_all_embeddings(self) -> Dict[str, np.ndarray]:
         manifest = self._load_manifest()
+        if not manifest:
+            return {}
+
+        if _io_uring_available() and len(manifest) >= _IO_URING_MIN_FILES:
+            try:
+                return self._read_all_io_uring(manifest)
+            except Exception:
+                pass  # fall back to the portable thread-pool path
+
+        def _read(item):
+            img_path, filename = item
+            try:
+                embedding = _load_npy(os.path.join(self.embeddings_dir, filename))
+                return img_path, embedding.astype(np.float32, copy=False)
+            except (OSError, ValueError):
+                return img_path, None
+
         embeddings = {}
-        
-        for img_path, filename in manifest.items():
-            emb_path = os.path.join(self.embeddings_dir, filename)
-            if os.path.exists(emb_path):
-                embeddings[img_path] = np.load(emb_path)
-        
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for img_path, embedding in executor.map(_read, manifest.items()):
+                if embedding is not None:
+                    embeddings[img_path] = embedding
+
         return embeddings
 
+    def get_embedding_matrix(self) -> Tuple[List[str], Optional[np.ndarray]]:
+        """Return (paths, matrix) with matrix row i belonging to paths[i].
+
+        Served from the packed store (memory-mapped, lazily faulted).
+        Entries written before the packed store existed are back-filled
+        from their .npy files once; stale rows (removed or re-embedded
+        paths) are filtered out via the manifest.
+        """
+        manifest = self._load_manifest()
+        if not manifest:
+            return [], None
+
+        ids, matrix = self.packed_store.load_matrix()
+
+        rows = {}
+        for i, img_path in enumerate(ids):
+            if img_path in manifest:
+                rows[img_path] = i  # later appends win
+
+        missing = [p for p in manifest if p not in rows]
+        if missing:
+            for img_path in missing:
+                embedding = self.load_embedding(img_path)
+                if embedding is not None:
+                    # Legacy files may predate normalize-at-save; fix
+                    # them up here so every packed row is unit-length.
+                    self.packed_store.append(img_path, _normalize(embedding))
+            ids, matrix = self.packed_store.load_matrix()
+            rows = {p: i for i, p in enumerate(ids) if p in manifest}
+
+        if not rows or matrix is None:
+            return [], None
+
+        paths = list(rows.keys())
+        index = np.fromiter(rows.values(), dtype=np.int64)
+        if len(index) == len(ids):
+            return paths, matrix  # common case: every row live, zero-copy
+        return paths, np.ascontiguousarray(matrix[index])
+
+    def store_version(self) -> int:
+        """Monotonic packed-store version (bytes appended so far).
+
+        Moves on every append — including a re-embed, which adds a row
+        without changing the live path list — so index consumers can
+        tell a pure append of new paths from a rewrite that demands a
+        rebuild.
+        """
+        try:
+            return os.path.getsize(self.packed_store.matrix_path)
+        except OSError:
+            return 0
+
     def get_all_image_paths(self) -> List[str]:
         manifest = self._load_manifest()
         return list(manifest.keys())
 
+    def cached_paths_set(self) -> set:
+        return set(self._load_manifest().keys())
+
+    def get_thumbnail(self, image_path: str) -> Optional[bytes]:
+        """JPEG thumbnail bytes for the results grid.
+
+        Decoding a multi-megapixel source just to paint 150px is the
+        slow part of displaying results; a one-time 300px JPEG reloads
+        in milliseconds on every later search. The key includes the
+        source's (mtime_ns, size) so an edited image gets a fresh
+        thumbnail instead of the stale one.
+        """
+        try:
+            st = os.stat(image_path)
+            key = f"{image_path}|{st.st_mtime_ns}|{st.st_size}"
+        except OSError:
+            key = image_path
+        thumb_path = os.path.join(self.thumbs_dir, f"{_hash_path(key)}.jpg")
+        try:
+            with open(thumb_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+
+        try:
+            image = Image.open(image_path)
+            image.thumbnail((300, 300), Image.Resampling.BILINEAR)
+            buf = io.BytesIO()
+            image.convert("RGB").save(buf, "JPEG", quality=80)
+        except Exception:
+            return None
+
+        data = buf.getvalue()
+        os.makedirs(self.thumbs_dir, exist_ok=True)
+        try:
+            with open(thumb_path, 'wb') as f:
+                f.write(data)
+        except OSError:
+            pass  # cache miss next time; still render this one
+        return data
+
+    def _meta(self) -> sqlite3.Connection:
+        if self._meta_db is None:
+            os.makedirs(self.base_cache_dir, exist_ok=True)
+            self._meta_db = sqlite3.connect(
+                os.path.join(self.base_cache_dir, "meta.db"),
+                check_same_thread=False)
+            self._meta_db.execute(
+                "CREATE TABLE IF NOT EXISTS text_embeddings "
+                "(key TEXT PRIMARY KEY, embedding BLOB)")
+            self._meta_db.execute(
+                "CREATE TABLE IF NOT EXISTS file_stats "
+                "(model TEXT, path TEXT, mtime_ns INTEGER, size INTEGER, "
+                "PRIMARY KEY (model, path))")
+        return self._meta_db
+
+    def _record_stats(self, image_paths: List[str]):
+        """Remember (mtime_ns, size) of each file at embedding time so
+        later scans can tell an edited image from an unchanged one."""
+        rows = []
+        for image_path in image_paths:
+            try:
+                st = os.stat(image_path)
+            except OSError:
+                continue  # vanished since embedding; scan will notice
+            rows.append((self.model_name, image_path, st.st_mtime_ns, st.st_size))
+        if not rows:
+            return
+        try:
+            db = self._meta()
+            db.executemany(
+                "INSERT OR REPLACE INTO file_stats (model, path, mtime_ns, size) "
+                "VALUES (?, ?, ?, ?)", rows)
+            db.commit()
+        except sqlite3.Error:
+            pass  # stats are advisory; the embedding itself is saved
+
+    def stat_index(self) -> Dict[str, Tuple[int, int]]:
+        """path -> (mtime_ns, size) recorded when each embedding was
+        written. Paths absent here (pre-stats caches) have no freshness
+        info and should be treated as fresh."""
+        try:
+            cur = self._meta().execute(
+                "SELECT path, mtime_ns, size FROM file_stats WHERE model = ?",
+                (self.model_name,))
+            return {path: (mtime_ns, size) for path, mtime_ns, size in cur}
+        except sqlite3.Error:
+            return {}
+
+    def _text_cache_key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\x00{text}".encode()).hexdigest()
+
+    def get_text_embedding(self, text: str) -> Optional[np.ndarray]:
+        """Text-query embedding persisted by a previous run, or None.
+
+        Repeated searches are common across sessions; serving them from
+        sqlite skips the text encoder entirely.
+        """
+        try:
+            row = self._meta().execute(
+                "SELECT embedding FROM text_embeddings WHERE key = ?",
+                (self._text_cache_key(text),)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float16).astype(np.float32)
+
+    def put_text_embedding(self, text: str, embedding: np.ndarray):
+        blob = np.asarray(embedding, dtype=np.float16).tobytes()
+        try:
+            db = self._meta()
+            db.execute(
+                "INSERT OR REPLACE INTO text_embeddings (key, embedding) VALUES (?, ?)",
+                (self._text_cache_key(text), blob))
+            db.commit()
+        except sqlite3.Error:
+            pass  # cache only; the computed embedding is still returned
+
     def remove_embedding(self, image_path: str):
         manifest = self._load_manifest()
-        
+
         if image_path in manifest:
             emb_path = os.path.join(self.embeddings_dir, manifest[image_path])
             if os.path.exists(emb_path):
                 os.remove(emb_path)
-            del manifest[image_path]
-            self._save_manifest(manifest)
+            self._append_manifest_entry(image_path, None)
+            try:
+                db = self._meta()
+                db.execute("DELETE FROM file_stats WHERE model = ? AND path = ?",
+                           (self.model_name, image_path))
+                db.commit()
+            except sqlite3.Error:
+                pass
 
     def clear_all(self):
         if os.path.exists(self.embeddings_dir):
-            for f in os.listdir(self.embeddings_dir):
-                os.remove(os.path.join(self.embeddings_dir, f))
+            shutil.rmtree(self.embeddings_dir)
+            os.makedirs(self.embeddings_dir, exist_ok=True)
+        self._shard_dirs_made = set()
+        self.packed_store.clear()
         self._save_manifest({})
+        try:
+            db = self._meta()
+            db.execute("DELETE FROM file_stats WHERE model = ?", (self.model_name,))
+            db.commit()
+        except sqlite3.Error:
+            pass
 
     def get_stats(self) -> dict:
         manifest = self._load_manifest()
         image_count = len(manifest)
-        
+
+        # Every embedding file has the same dtype and shape, so one stat
+        # of a single file prices the whole cache; the UI refreshes
+        # stats often and should not walk N files each time.
         total_size = 0
-        if os.path.exists(self.embeddings_dir):
-            for f in os.listdir(self.embeddings_dir):
-                fpath = os.path.join(self.embeddings_dir, f)
-                if os.path.isfile(fpath):
-                    total_size += os.path.getsize(fpath)
-        
-        folders = set()
-        for img_path in manifest.keys():
-            folders.add(os.path.dirname(img_path))
-        
+        if image_count:
+            first = next(iter(manifest.values()))
+            try:
+                per_file = os.path.getsize(os.path.join(self.embeddings_dir, first))
+            except OSError:
+                per_file = 0
+            total_size = per_file * image_count
+        # The packed float32 matrix duplicates every vector at twice the
+        # fp16 blob bytes; without it the reported size is ~1/3 of what
+        # is actually on disk.
+        try:
+            total_size += os.path.getsize(self.packed_store.matrix_path)
+        except OSError:
+            pass
+
+        folders = {os.path.dirname(p) for p in manifest}
+
         return {
             "image_count": image_count,
             "cache_size_mb": total_size / (1024 * 1024),
@@ -1,73 +1,476 @@
 import torch
+import numpy as np
 from PIL import Image
 from transformers import CLIPModel, CLIPProcessor
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 import os
+import threading
+
+try:
+    from torchvision.transforms import v2 as tv_transforms
+    from torchvision import io as tv_io
+except ImportError:
+    tv_transforms = None
+    tv_io = None
+
+_JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+CLIP_MEAN = [0.48145466, 0.4578275, 0.40821073]
+CLIP_STD = [0.26862954, 0.26130258, 0.27577711]
+
+_CLIP_MEAN_ARR = np.asarray(CLIP_MEAN, dtype=np.float32)
+_CLIP_STD_ARR = np.asarray(CLIP_STD, dtype=np.float32)
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _normalize_batch_numba(batch_u8, mean, std, out):
+        # uint8 HWC -> normalized float32 CHW, all cores at once.
+        b, h, w, _c = batch_u8.shape
+        for i in numba.prange(b):
+            for c in range(3):
+                m = mean[c]
+                s = std[c]
+                for y in range(h):
+                    for x in range(w):
+                        out[i, c, y, x] = (batch_u8[i, y, x, c] / 255.0 - m) / s
+
+
+def _decode_to_array(image_path, size):
+    image = Image.open(image_path)
+    # For JPEGs, draft lets libjpeg scale during the IDCT: a 12MP
+    # photo headed for 224px decodes at 1/8 scale instead of full
+    # resolution. No-op for other formats.
+    image.draft("RGB", (size, size))
+    image = image.convert("RGB")
+    w, h = image.size
+    scale = size / min(w, h)
+    image = image.resize(
+        (max(size, round(w * scale)), max(size, round(h * scale))),
+        Image.BICUBIC,
+    )
+    w, h = image.size
+    left = (w - size) // 2
+    top = (h - size) // 2
+    image = image.crop((left, top, left + size, top + size))
+    return np.asarray(image)
+
+
+def _decode_worker(args):
+    """Decode + resize + center-crop in a worker process.
+
+    Top-level so it pickles for ProcessPoolExecutor; PIL holds the GIL
+    while decoding, so threads alone cannot saturate the CPU.
+    """
+    image_path, size = args
+    try:
+        return image_path, _decode_to_array(image_path, size)
+    except Exception as e:
+        print(f"Error processing {image_path}: {e}")
+        return image_path, None
+
+
+_worker_shm = None
+
+
+def _attach_shm(name):
+    # One attach per worker process per pipeline run; re-attach only
+    # when a new run hands out a different block.
+    global _worker_shm
+    if _worker_shm is None or _worker_shm.name.lstrip('/') != name.lstrip('/'):
+        if _worker_shm is not None:
+            _worker_shm.close()
+        _worker_shm = shared_memory.SharedMemory(name=name)
+    return _worker_shm
+
+
+def _decode_worker_shm(args):
+    """Like _decode_worker, but writes pixels into a shared-memory slot.
+
+    Returning ~150 KB arrays pickles them through the executor pipe;
+    writing into the caller's SharedMemory block and returning just the
+    slot number makes the transfer zero-copy.
+    """
+    image_path, size, shm_name, slot = args
+    try:
+        arr = _decode_to_array(image_path, size)
+        shm = _attach_shm(shm_name)
+        row_bytes = size * size * 3
+        view = np.ndarray((size, size, 3), dtype=np.uint8,
+                          buffer=shm.buf, offset=slot * row_bytes)
+        view[:] = arr
+        return image_path, slot
+    except Exception as e:
+        print(f"Error processing {image_path}: {e}")
+        return image_path, None
 
 
 class CLIPService:
+    BATCH_SIZE = 32
+
     def __init__(self, model_name: str = "openai/clip-vit-base-patch32"):
         self.model_name = model_name
         self.model = None
         self.processor = None
+        self.device = "cpu"
+        self._staging = None
+        self._copy_stream = None
+        self._gpu_transform = None
+        self._try_nvjpeg = True
+        self._decode_pool = None
+        # The warm-load thread and the first UI-triggered call may race
+        # into load(); the lock makes it single-entry, and load() itself
+        # re-checks model_name before publishing so a set_model() call
+        # landing mid-load can't publish the old model under the new
+        # name.
+        self._load_lock = threading.Lock()
 
     def set_model(self, model_name: str):
         if model_name != self.model_name:
             self.model_name = model_name
             self.model = None
             self.processor = None
+            self._staging = None
+            self._copy_stream = None
+            self._gpu_transform = None
 
     def load(self):
-        if self.model is None:
-            self.processor = CLIPProcessor.from_pretrained(self.model_name)
-            self.model = CLIPModel.from_pretrained(self.model_name)
-            self.model.eval()
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return  # another thread finished the load meanwhile
+            # Snapshot the requested model: set_model() may retarget the
+            # service while the weights download. Everything below builds
+            # into locals keyed off this name and only publishes if the
+            # name still matches at the end.
+            model_name = self.model_name
+            processor = CLIPProcessor.from_pretrained(model_name)
+            model = CLIPModel.from_pretrained(model_name)
+            model.eval()
+            copy_stream = None
+            gpu_transform = None
             if torch.cuda.is_available():
-                self.model = self.model.to("cuda")
+                device = "cuda"
+            elif torch.backends.mps.is_available():
+                device = "mps"
+            else:
+                device = "cpu"
+            if device == "mps":
+                # Apple GPU: resident weights, eager fp32 (fp16 autocast
+                # and the CUDA-specific staging/stream paths don't apply).
+                model = model.to("mps")
+            if device == "cuda":
+                model = model.to("cuda", dtype=torch.float16)
+                copy_stream = torch.cuda.Stream()
+                if tv_transforms is not None:
+                    size = processor.image_processor.crop_size["height"]
+                    gpu_transform = tv_transforms.Compose([
+                        tv_transforms.Resize(
+                            size,
+                            interpolation=tv_transforms.InterpolationMode.BICUBIC,
+                            antialias=True,
+                        ),
+                        tv_transforms.CenterCrop(size),
+                        tv_transforms.ToDtype(torch.float32, scale=True),
+                        tv_transforms.Normalize(mean=CLIP_MEAN, std=CLIP_STD),
+                    ])
+                try:
+                    # Compile the entry points we actually call, not the
+                    # module: torch.compile(model) only wraps forward(),
+                    # and attribute access on the OptimizedModule falls
+                    # through to the uncompiled _orig_mod, so
+                    # get_image_features/get_text_features would run
+                    # eager and the warmup graphs would never be hit.
+                    # (reduce-overhead cudagraphs + inference_mode in
+                    # _forward can misbehave on some torch versions; the
+                    # warmup below surfaces that, and we fall back to
+                    # eager.)
+                    # dynamic=False: the app only ever runs the warmed
+                    # shapes (batch 1/BATCH_SIZE images, 77-token text),
+                    # so specialized static-shape graphs beat the
+                    # dynamic-shape guards.
+                    model.get_image_features = torch.compile(
+                        model.get_image_features, mode="reduce-overhead",
+                        dynamic=False)
+                    model.get_text_features = torch.compile(
+                        model.get_text_features, mode="reduce-overhead",
+                        dynamic=False)
+                except Exception:
+                    pass  # older torch or unsupported backend; eager is fine
+            if self.model_name != model_name:
+                # set_model() retargeted the service mid-load. Publishing
+                # this model would serve (and cache!) the old model's
+                # vectors under the new model's name, so drop it; the
+                # warm-load thread spawned by the switch is blocked on
+                # this lock and will load the right model next.
+                return
+            # Publish the model last: unlocked callers treat self.model
+            # as the loaded flag, so a partially initialized service
+            # must never be visible.
+            self.device = device
+            self._copy_stream = copy_stream
+            self._gpu_transform = gpu_transform
+            self.processor = processor
+            self.model = model
+            if self.device == "cuda":
+                try:
+                    self._warmup()
+                except Exception:
+                    pass
+
+    def _warmup(self):
+        """Trace/capture the shapes the app actually uses.
+
+        reduce-overhead records CUDA graphs per input shape, so run the
+        single-image and full-batch image shapes plus the fixed-length
+        text shape once at load instead of stalling the first search.
+        """
+        size = self.processor.image_processor.crop_size["height"]
+        for batch in (1, self.BATCH_SIZE):
+            dummy = torch.zeros((batch, 3, size, size), device="cuda")
+            self._forward(self.model.get_image_features, {"pixel_values": dummy})
+        inputs = self.processor(text=["warmup"], return_tensors="pt",
+                                padding="max_length", max_length=77, truncation=True)
+        inputs = {k: v.to("cuda") for k, v in inputs.items()}
+        self._forward(self.model.get_text_features, inputs)
+
+    def _to_device_pixels(self, pixel_values: "torch.Tensor") -> "torch.Tensor":
+        """Stage pixels in a reusable pinned buffer and copy async to CUDA.
+
+        A pinned source lets the DMA engine do the transfer without a
+        bounce through pageable memory; doing it on a dedicated stream
+        lets the next batch's preprocessing overlap the copy.
+        """
+        n = pixel_values.shape[0]
+        if (self._staging is None
+                or self._staging.shape[0] < n
+                or self._staging.shape[1:] != pixel_values.shape[1:]):
+            shape = (max(n, self.BATCH_SIZE),) + tuple(pixel_values.shape[1:])
+            self._staging = torch.empty(shape, dtype=pixel_values.dtype, pin_memory=True)
+
+        staging = self._staging[:n]
+        staging.copy_(pixel_values)
+        with torch.cuda.stream(self._copy_stream):
+            device_pixels = staging.to("cuda", non_blocking=True)
+        torch.cuda.current_stream().wait_stream(self._copy_stream)
+        return device_pixels
+
+    def _forward(self, encode_fn, inputs) -> "torch.Tensor":
+        with torch.inference_mode():
+            if self.device == "cuda":
+                with torch.autocast("cuda", dtype=torch.float16):
+                    features = encode_fn(**inputs)
+            else:
+                features = encode_fn(**inputs)
+        # Cast back to float32 so cosine similarity downstream stays stable.
+        return features.float().cpu().numpy()
 
     def get_image_embedding(self, image_path: str) -> torch.Tensor:
         if self.model is None:
             self.load()
-        
-        image = Image.open(image_path).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt")
-        
-        if torch.cuda.is_available():
-            inputs = {k: v.to("cuda") for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            image_features = self.model.get_image_features(**inputs)
-        
-        return image_features.squeeze().cpu().numpy()
+
+        image = self._decode_image(image_path)
+        return self._embed_image_batch([image])[0]
 
     def get_text_embedding(self, text: str) -> torch.Tensor:
         if self.model is None:
             self.load()
-        
-        inputs = self.processor(text=[text], return_tensors="pt", padding=True)
-        
-        if torch.cuda.is_available():
-            inputs = {k: v.to("cuda") for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            text_features = self.model.get_text_features(**inputs)
-        
-        return text_features.squeeze().cpu().numpy()
+
+        # Fixed-length padding keeps the text shape static so compiled/
+        # graph-captured kernels are reused across queries.
+        inputs = self.processor(text=[text], return_tensors="pt",
+                                padding="max_length", max_length=77, truncation=True)
+
+        if self.device != "cpu":
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+
+        return self._forward(self.model.get_text_features, inputs).squeeze()
+
+    def _decode_image(self, image_path: str):
+        """Decode to RGB, preferring torchvision's libjpeg-turbo path.
+
+        JPEGs go through tv_io (SIMD IDCT; NVDEC on the GPU when
+        available), returning a CHW uint8 tensor. Everything else, and
+        any decode failure, falls back to PIL.
+        """
+        if tv_io is not None and os.path.splitext(image_path)[1].lower() in _JPEG_EXTENSIONS:
+            if self._try_nvjpeg and self.device == "cuda":
+                try:
+                    data = tv_io.read_file(image_path)
+                    return tv_io.decode_jpeg(data, mode=tv_io.ImageReadMode.RGB, device="cuda")
+                except RuntimeError:
+                    self._try_nvjpeg = False  # no nvjpeg support; stop probing
+                except Exception:
+                    pass  # corrupt file perhaps; let the paths below try
+            try:
+                return tv_io.read_image(image_path, tv_io.ImageReadMode.RGB)
+            except Exception:
+                pass
+        image = Image.open(image_path)
+        size = self.processor.image_processor.crop_size["height"]
+        image.draft("RGB", (size, size))  # scaled JPEG decode; no-op otherwise
+        return image.convert("RGB")
+
+    def _embed_image_batch(self, images: list) -> "torch.Tensor":
+        if self._gpu_transform is not None:
+            # Ship raw uint8 pixels to the GPU and run resize/crop/
+            # normalize there as batched CUDA kernels; the CPU only pays
+            # for the decode.
+            def _as_device_tensor(image):
+                if isinstance(image, torch.Tensor):
+                    return image.to("cuda", non_blocking=True)
+                return torch.from_numpy(np.asarray(image)).permute(2, 0, 1).to("cuda", non_blocking=True)
+
+            pixel_values = torch.stack([
+                self._gpu_transform(_as_device_tensor(image)) for image in images
+            ])
+            inputs = {"pixel_values": pixel_values}
+        else:
+            images = [
+                image.cpu().permute(1, 2, 0).numpy() if isinstance(image, torch.Tensor) else image
+                for image in images
+            ]
+            inputs = self.processor(images=images, return_tensors="pt")
+            if self.device == "cuda":
+                inputs = {"pixel_values": self._to_device_pixels(inputs["pixel_values"])}
+            elif self.device != "cpu":
+                inputs = {"pixel_values": inputs["pixel_values"].to(self.device)}
+
+        return self._forward(self.model.get_image_features, inputs)
+
+    def _embed_preprocessed_batch(self, arrays: list) -> "torch.Tensor":
+        # Arrays were already resized/cropped by the decode workers, so
+        # only rescale/normalize/transpose remains. With numba that runs
+        # as one parallel JIT kernel instead of the processor's
+        # per-image Python loop.
+        if numba is not None:
+            batch = np.stack(arrays)
+            out = np.empty((batch.shape[0], 3, batch.shape[1], batch.shape[2]),
+                           dtype=np.float32)
+            _normalize_batch_numba(batch, _CLIP_MEAN_ARR, _CLIP_STD_ARR, out)
+            inputs = {"pixel_values": torch.from_numpy(out)}
+        else:
+            inputs = self.processor(images=arrays, return_tensors="pt",
+                                    do_resize=False, do_center_crop=False)
+        if self.device == "cuda":
+            inputs = {"pixel_values": self._to_device_pixels(inputs["pixel_values"])}
+        elif self.device != "cpu":
+            inputs = {"pixel_values": inputs["pixel_values"].to(self.device)}
+        return self._forward(self.model.get_image_features, inputs)
 
     def batch_process_images(self, image_paths: list, progress_callback=None) -> dict:
         if self.model is None:
             self.load()
-        
+
         results = {}
         total = len(image_paths)
-        
-        for i, img_path in enumerate(image_paths):
+        done = 0
+
+        def _decode(path):
             try:
-                embedding = self.get_image_embedding(img_path)
-                results[img_path] = embedding
+                return path, self._decode_image(path)
             except Exception as e:
-                print(f"Error processing {img_path}: {e}")
-            
+                print(f"Error processing {path}: {e}")
+                return path, None
+
+        # With GPU preprocessing the workers only decode, so threads
+        # suffice (the decode itself releases the GIL in turbo-jpeg).
+        # On the CPU path decode+resize is GIL-bound Python/PIL work, so
+        # fan it out across processes instead.
+        use_processes = self._gpu_transform is None
+        embed_batch = self._embed_preprocessed_batch if use_processes else self._embed_image_batch
+
+        batch_paths = []
+        batch_images = []
+
+        def _flush():
+            nonlocal done
+            if not batch_images:
+                return
+            features = embed_batch(batch_images)
+            for path, row in zip(batch_paths, features):
+                results[path] = row
+            done += len(batch_paths)
+            batch_paths.clear()
+            batch_images.clear()
             if progress_callback:
-                progress_callback(i + 1, total)
-        
+                progress_callback(done, total)
+
+        # Keep the decoders about two batches ahead of the model: deep
+        # enough that compute never starves, shallow enough that decoded
+        # frames for a huge folder never pile up in memory (Executor.map
+        # would submit everything at once).
+        decode_depth = self.BATCH_SIZE * 2
+
+        def _prefetch(executor, fn, items):
+            window = deque()
+            for item in items:
+                window.append(executor.submit(fn, item))
+                if len(window) >= decode_depth:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+
+        thread_pool = None
+        shm = None
+        if use_processes:
+            if self._decode_pool is None:
+                self._decode_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+            size = self.processor.image_processor.crop_size["height"]
+            row_bytes = size * size * 3
+            # Workers write decoded pixels into a shared ring instead of
+            # pickling ~150 KB arrays through the executor pipe. One
+            # extra slot beyond the prefetch window: _prefetch submits
+            # item i+depth before yielding item i, so depth+1 slots
+            # guarantee a slot is never rewritten before its consumer
+            # copies it out.
+            num_slots = decode_depth + 1
+            try:
+                shm = shared_memory.SharedMemory(create=True, size=num_slots * row_bytes)
+            except OSError:
+                shm = None  # no /dev/shm or size limit; pickle fallback
+            if shm is not None:
+                slot_views = [
+                    np.ndarray((size, size, 3), dtype=np.uint8,
+                               buffer=shm.buf, offset=i * row_bytes)
+                    for i in range(num_slots)
+                ]
+                raw = _prefetch(self._decode_pool, _decode_worker_shm,
+                                [(p, size, shm.name, i % num_slots)
+                                 for i, p in enumerate(image_paths)])
+                decoded = ((path, None if slot is None else slot_views[slot].copy())
+                           for path, slot in raw)
+            else:
+                decoded = _prefetch(self._decode_pool, _decode_worker,
+                                    [(p, size) for p in image_paths])
+        else:
+            thread_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+            decoded = _prefetch(thread_pool, _decode, image_paths)
+
+        try:
+            for path, image in decoded:
+                if image is None:
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, total)
+                    continue
+                batch_paths.append(path)
+                batch_images.append(image)
+                if len(batch_images) >= self.BATCH_SIZE:
+                    _flush()
+            _flush()
+        finally:
+            if thread_pool is not None:
+                thread_pool.shutdown()
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
         return results
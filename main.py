@@ -1,6 +1,10 @@
 import sys
 import os
+import functools
 import subprocess
+import threading
+import time
+from collections import OrderedDict
 from PIL import Image
 
 from PyQt6.QtWidgets import (
@@ -9,8 +13,8 @@ from PyQt6.QtWidgets import (
     QVBoxLayout, QHBoxLayout, QMessageBox, QFileDialog, QMenu,
     QListWidget, QGroupBox, QComboBox
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSize
-from PyQt6.QtGui import QPixmap, QAction, QPalette, QColor, QDragEnterEvent, QDropEvent
+from PyQt6.QtCore import Qt, QThread, QObject, QRunnable, QThreadPool, pyqtSignal, QSize
+from PyQt6.QtGui import QPixmap, QImage, QAction, QPalette, QColor, QDragEnterEvent, QDropEvent
 
 from clip_service import CLIPService
 from cache_manager import CacheManager
@@ -28,37 +32,98 @@ MODELS = [
 DEFAULT_MODEL = "clip-vit-base-patch32"
 
 
+@functools.lru_cache(maxsize=4096)
+def _display_name(img_path):
+    # The same paths come back search after search; memoize the
+    # basename + truncation instead of redoing the string work.
+    name = os.path.basename(img_path)
+    return name[:30] + "..." if len(name) > 30 else name
+
+
 class EmbeddingWorker(QThread):
     progress = pyqtSignal(int, int)
     finished = pyqtSignal(int)
     error = pyqtSignal(str)
     status = pyqtSignal(str)
 
+    # Images per batch_process_images call; one manifest write per chunk
+    # keeps memory bounded on huge folders.
+    CHUNK_SIZE = 256
+
     def __init__(self, clip_service, cache_manager, images):
         super().__init__()
         self.clip_service = clip_service
         self.cache_manager = cache_manager
         self.images = images
+        self._last_emit = 0.0
+
+    def _emit_progress(self, done, total):
+        # Throttle cross-thread signal dispatches: on a fast GPU the
+        # per-batch callbacks would otherwise flood the Qt event loop.
+        now = time.monotonic()
+        if now - self._last_emit > 0.1 or done == total:
+            self._last_emit = now
+            self.progress.emit(done, total)
 
     def run(self):
         try:
             self.clip_service.load()
             total = len(self.images)
-            
-            for i, img_path in enumerate(self.images):
+
+            for start in range(0, total, self.CHUNK_SIZE):
+                batch = self.images[start:start + self.CHUNK_SIZE]
                 try:
-                    embedding = self.clip_service.get_image_embedding(img_path)
-                    self.cache_manager.save_embedding(img_path, embedding)
+                    results = self.clip_service.batch_process_images(
+                        batch,
+                        progress_callback=lambda done, _t, base=start: self._emit_progress(base + done, total),
+                    )
+                    self.cache_manager.save_embeddings_bulk(results)
                 except Exception as e:
+                    # Batched forward failed (e.g. out of memory); fall
+                    # back to one image at a time for this chunk.
                     print(f"Error: {e}")
-                
-                self.progress.emit(i + 1, total)
-            
+                    for i, img_path in enumerate(batch):
+                        try:
+                            embedding = self.clip_service.get_image_embedding(img_path)
+                            self.cache_manager.save_embedding(img_path, embedding)
+                        except Exception as e:
+                            print(f"Error: {e}")
+                        self._emit_progress(start + i + 1, total)
+
             self.finished.emit(total)
         except Exception as e:
             self.error.emit(str(e))
 
 
+class ThumbLoaderSignals(QObject):
+    loaded = pyqtSignal(int, int, QImage)
+
+
+class ThumbLoader(QRunnable):
+    """Decode one result thumbnail off the GUI thread.
+
+    QImage is safe to build in a worker; the QPixmap conversion happens
+    back on the GUI thread in the slot.
+    """
+
+    def __init__(self, generation, index, img_path, cache_manager, signals):
+        super().__init__()
+        self.generation = generation
+        self.index = index
+        self.img_path = img_path
+        self.cache_manager = cache_manager
+        self.signals = signals
+
+    def run(self):
+        image = QImage()
+        data = self.cache_manager.get_thumbnail(self.img_path)
+        if data is not None:
+            image.loadFromData(data)
+        if image.isNull():
+            image.load(self.img_path)
+        self.signals.loaded.emit(self.generation, self.index, image)
+
+
 class SearchWorker(QThread):
     finished = pyqtSignal(list)
     error = pyqtSignal(str)
@@ -98,14 +163,41 @@ class ImageSearchApp(QMainWindow):
         self.embedding_worker = None
         self.search_worker = None
 
+        self._thumb_pool = QThreadPool.globalInstance()
+        self._thumb_signals = ThumbLoaderSignals()
+        self._thumb_signals.loaded.connect(self._on_thumb_loaded)
+        self._thumb_labels = {}
+        self._results_generation = 0
+        self._result_frames = []
+        self._no_results_label = None
+        # Scaled drop-zone previews keyed by (path, mtime); repeated
+        # image queries on the same file skip the full decode.
+        self._drop_pixmap_cache = OrderedDict()
+        # dir -> (dir mtime_ns, files, subdirs); see _scan_dir.
+        self._dir_scan_cache = {}
+
         self.current_theme = 'dark'
-        
+
         self.setWindowTitle("CLIP Image Search")
         self.setGeometry(100, 100, 1000, 700)
 
+        self._clipboard = QApplication.clipboard()
+        self._build_context_menu()
         self._setup_ui()
         self._apply_theme()
 
+        # Load the model in the background so the first search or
+        # embedding run finds it already resident. CLIPService.load is
+        # locked and idempotent, so an early click just waits on it.
+        threading.Thread(target=self._warm_load_clip, daemon=True).start()
+
+    def _warm_load_clip(self):
+        try:
+            self.clip_service.load()
+            self.model_loaded = True
+        except Exception as e:
+            print(f"Error preloading model: {e}")
+
     def _setup_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -347,6 +439,7 @@ class ImageSearchApp(QMainWindow):
         self._clear_results()
         self._update_stats()
         self.status_label.setText(f"Switched to {new_model}")
+        threading.Thread(target=self._warm_load_clip, daemon=True).start()
 
     def _add_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Folder")
@@ -364,16 +457,73 @@ class ImageSearchApp(QMainWindow):
         size_mb = stats["cache_size_mb"]
         self.stats_label.setText(f"[{self.current_model}] Cached: {stats['image_count']} images ({size_mb:.1f} MB)")
 
+    def _scan_dir(self, d):
+        """(files, subdirs) for one directory, where files are
+        (path, mtime_ns, size) triples from the scandir-cached stat.
+
+        Results are memoized on the directory's own mtime for the
+        lifetime of the app: re-scans of an unchanged tree skip the
+        readdir and stat work entirely. Adding or removing entries
+        bumps the directory mtime and invalidates its slot; an in-place
+        edit inside an untouched directory is picked up on the next app
+        start (the cache is in-memory only).
+        """
+        try:
+            dir_mtime = os.stat(d).st_mtime_ns
+        except OSError:
+            return [], []
+        cached = self._dir_scan_cache.get(d)
+        if cached is not None and cached[0] == dir_mtime:
+            return cached[1], cached[2]
+
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        name = entry.name
+                        i = name.rfind('.')
+                        if i >= 0 and name[i:].lower() in SUPPORTED_EXTENSIONS:
+                            try:
+                                st = entry.stat()
+                            except OSError:
+                                continue
+                            files.append((entry.path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            return [], []  # unreadable directory; skip, do not cache
+
+        self._dir_scan_cache[d] = (dir_mtime, files, subdirs)
+        return files, subdirs
+
+    def _iter_images(self, root):
+        # os.walk builds per-directory name lists and re-stats entries;
+        # scandir with a manual stack (memoized per directory in
+        # _scan_dir) yields (path, mtime_ns, size) triples straight
+        # from the directory read.
+        stack = [root]
+        while stack:
+            files, subdirs = self._scan_dir(stack.pop())
+            stack.extend(subdirs)
+            yield from files
+
     def _get_images_from_folders(self):
         images = []
+        # One manifest snapshot instead of a has_embedding lookup (and
+        # its embedding-file stat) per file; the stat index catches
+        # files edited since they were embedded.
+        cached = self.cache_manager.cached_paths_set()
+        stats = self.cache_manager.stat_index()
         for folder in self.folders:
-            for root, dirs, files in os.walk(folder):
-                for f in files:
-                    ext = os.path.splitext(f)[1].lower()
-                    if ext in SUPPORTED_EXTENSIONS:
-                        img_path = os.path.join(root, f)
-                        if not self.cache_manager.has_embedding(img_path):
-                            images.append(img_path)
+            for img_path, mtime_ns, size in self._iter_images(folder):
+                if img_path not in cached:
+                    images.append(img_path)
+                    continue
+                recorded = stats.get(img_path)
+                if recorded is not None and (mtime_ns, size) != recorded:
+                    images.append(img_path)
         return images
 
     def _start_embedding(self):
@@ -412,6 +562,7 @@ class ImageSearchApp(QMainWindow):
         self.embedding = False
         self.progress.setVisible(False)
         self.status_label.setText(f"Done! {total} images processed")
+        self.search_engine.mark_index_dirty()
         self._update_stats()
         self.model_loaded = True
         self.gen_embeddings_btn.setEnabled(True)
@@ -432,6 +583,7 @@ class ImageSearchApp(QMainWindow):
         )
         if reply == QMessageBox.StandardButton.Yes:
             self.cache_manager.clear_all()
+            self.search_engine.mark_index_dirty()
             self.status_label.setText("Cache cleared")
             self._update_stats()
 
@@ -472,67 +624,93 @@ class ImageSearchApp(QMainWindow):
         QMessageBox.critical(self, "Error", error_msg)
 
     def _clear_results(self):
-        while self.results_layout.count():
-            item = self.results_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
+        # Frames are pooled, not destroyed: rebuilding the widget tree
+        # on every search thrashes Qt's layout machinery.
+        for frame, _img, _score, _name in self._result_frames:
+            frame.setVisible(False)
+        if self._no_results_label is not None:
+            self._no_results_label.setVisible(False)
+
+    def _ensure_result_pool(self, count):
+        max_cols = 4
+        while len(self._result_frames) < count:
+            index = len(self._result_frames)
+
+            frame = QFrame()
+            frame.setFrameStyle(QFrame.Shape.StyledPanel | QFrame.Shadow.Raised)
+            frame_layout = QVBoxLayout(frame)
+            frame_layout.setSpacing(3)
+            frame_layout.setContentsMargins(5, 5, 5, 5)
+
+            img_label = QLabel()
+            img_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            img_label.setCursor(Qt.CursorShape.PointingHandCursor)
+            # Fixed footprint keeps the grid stable while the
+            # thumbnail streams in from the worker pool.
+            img_label.setMinimumSize(150, 150)
+            frame_layout.addWidget(img_label)
+
+            score_label = QLabel()
+            score_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            score_label.setStyleSheet("font-size: 8pt;")
+            frame_layout.addWidget(score_label)
+
+            name_label = QLabel()
+            name_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            name_label.setStyleSheet("font-size: 7pt;")
+            name_label.setWordWrap(True)
+            name_label.setCursor(Qt.CursorShape.PointingHandCursor)
+            frame_layout.addWidget(name_label)
+
+            frame.setVisible(False)
+            self.results_layout.addWidget(frame, index // max_cols, index % max_cols)
+            self._result_frames.append((frame, img_label, score_label, name_label))
+
+    def _on_thumb_loaded(self, generation, index, image):
+        if generation != self._results_generation or image.isNull():
+            return
+        label = self._thumb_labels.get(index)
+        if label is None:
+            return
+        pixmap = QPixmap.fromImage(image).scaled(
+            150, 150, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        label.setPixmap(pixmap)
 
     def _display_results(self, results):
         self._clear_results()
-        
+        self._results_generation += 1
+        self._thumb_labels = {}
+
         if not results:
-            no_results = QLabel("No results found")
-            no_results.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.results_layout.addWidget(no_results, 0, 0, 1, 4)
+            if self._no_results_label is None:
+                self._no_results_label = QLabel("No results found")
+                self._no_results_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+                self.results_layout.addWidget(self._no_results_label, 0, 0, 1, 4)
+            self._no_results_label.setVisible(True)
             return
 
-        row = 0
-        col = 0
-        max_cols = 4
+        self._ensure_result_pool(len(results))
 
-        for img_path, score in results:
+        for index, (img_path, score) in enumerate(results):
             try:
-                frame = QFrame()
-                frame.setFrameStyle(QFrame.Shape.StyledPanel | QFrame.Shadow.Raised)
-                frame_layout = QVBoxLayout(frame)
-                frame_layout.setSpacing(3)
-                frame_layout.setContentsMargins(5, 5, 5, 5)
-                
-                img_label = QLabel()
-                img_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                img_label.setCursor(Qt.CursorShape.PointingHandCursor)
-                
-                pixmap = QPixmap(img_path)
-                if pixmap.isNull():
-                    continue
-                pixmap = pixmap.scaled(150, 150, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-                img_label.setPixmap(pixmap)
+                frame, img_label, score_label, name_label = self._result_frames[index]
+
+                img_label.setPixmap(QPixmap())
                 img_label.mousePressEvent = lambda e, p=img_path: self._open_image(p) if e.button() == Qt.MouseButton.LeftButton else None
                 img_label.contextMenuEvent = lambda e, p=img_path, w=frame: self._show_context_menu(e, p, w)
-                
-                frame_layout.addWidget(img_label)
-                
-                score_label = QLabel(f"{score:.3f}")
-                score_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                score_label.setStyleSheet("font-size: 8pt;")
-                frame_layout.addWidget(score_label)
-                
-                filename = os.path.basename(img_path)
-                name_label = QLabel(filename[:30] + "..." if len(filename) > 30 else filename)
-                name_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                name_label.setStyleSheet("font-size: 7pt;")
-                name_label.setWordWrap(True)
-                name_label.setCursor(Qt.CursorShape.PointingHandCursor)
+
+                score_label.setText(f"{score:.3f}")
+
+                name_label.setText(_display_name(img_path))
                 name_label.mousePressEvent = lambda e, p=img_path: self._open_image(p) if e.button() == Qt.MouseButton.LeftButton else None
-                frame_layout.addWidget(name_label)
-                
-                self.results_layout.addWidget(frame, row, col)
-                
-                col += 1
-                if col >= max_cols:
-                    col = 0
-                    row += 1
-            
+
+                frame.setVisible(True)
+
+                self._thumb_labels[index] = img_label
+                self._thumb_pool.start(ThumbLoader(
+                    self._results_generation, index, img_path,
+                    self.cache_manager, self._thumb_signals))
+
             except Exception as e:
                 print(f"Error displaying {img_path}: {e}")
 
@@ -540,22 +718,28 @@ class ImageSearchApp(QMainWindow):
         if os.path.exists(img_path):
             subprocess.run(["xdg-open", img_path])
 
-    def _show_context_menu(self, event, img_path, widget):
-        menu = QMenu(self)
-        
+    def _build_context_menu(self):
+        # Built once; _show_context_menu just retargets the path. The
+        # actions close over self._ctx_menu_path so no disconnect/
+        # reconnect churn per right-click.
+        self._ctx_menu_path = None
+        self._ctx_menu = QMenu(self)
+
         open_path_action = QAction("Open Path", self)
-        open_path_action.triggered.connect(lambda: self._open_folder(img_path))
-        menu.addAction(open_path_action)
-        
+        open_path_action.triggered.connect(lambda: self._open_folder(self._ctx_menu_path))
+        self._ctx_menu.addAction(open_path_action)
+
         copy_path_action = QAction("Copy Path", self)
-        copy_path_action.triggered.connect(lambda: self._copy_path(img_path))
-        menu.addAction(copy_path_action)
-        
+        copy_path_action.triggered.connect(lambda: self._copy_path(self._ctx_menu_path))
+        self._ctx_menu.addAction(copy_path_action)
+
         copy_image_action = QAction("Copy Image", self)
-        copy_image_action.triggered.connect(lambda: self._copy_image(img_path))
-        menu.addAction(copy_image_action)
-        
-        menu.exec(event.globalPos())
+        copy_image_action.triggered.connect(lambda: self._copy_image(self._ctx_menu_path))
+        self._ctx_menu.addAction(copy_image_action)
+
+    def _show_context_menu(self, event, img_path, widget):
+        self._ctx_menu_path = img_path
+        self._ctx_menu.exec(event.globalPos())
 
     def _open_folder(self, img_path):
         folder = os.path.dirname(img_path)
@@ -563,14 +747,11 @@ class ImageSearchApp(QMainWindow):
             subprocess.run(["xdg-open", folder])
 
     def _copy_path(self, img_path):
-        clipboard = QApplication.clipboard()
-        clipboard.setText(img_path)
+        self._clipboard.setText(img_path)
 
     def _copy_image(self, img_path):
         if os.path.exists(img_path):
-            pixmap = QPixmap(img_path)
-            clipboard = QApplication.clipboard()
-            clipboard.setPixmap(pixmap)
+            self._clipboard.setPixmap(QPixmap(img_path))
 
     def _browse_image(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -587,9 +768,20 @@ class ImageSearchApp(QMainWindow):
             return
         
         self.drop_image_path = image_path
-        
+
         try:
-            pixmap = QPixmap(image_path).scaled(180, 50, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+            try:
+                key = (image_path, os.path.getmtime(image_path))
+            except OSError:
+                key = (image_path, -1.0)
+            pixmap = self._drop_pixmap_cache.get(key)
+            if pixmap is None:
+                pixmap = QPixmap(image_path).scaled(180, 50, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+                self._drop_pixmap_cache[key] = pixmap
+                while len(self._drop_pixmap_cache) > 8:
+                    self._drop_pixmap_cache.popitem(last=False)
+            else:
+                self._drop_pixmap_cache.move_to_end(key)
             self.drop_label.setPixmap(pixmap)
             self.drop_label.setText("")
         except Exception as e:
@@ -627,7 +819,12 @@ class DropFrame(QFrame):
         if event.mimeData().hasUrls():
             url = event.mimeData().urls()[0]
             if url.isLocalFile():
-                self.image_dropped.emit(url.toLocalFile())
+                # Check the extension before touching the file: rejecting
+                # here avoids a speculative QPixmap decode of whatever
+                # was dropped (including multi-GB non-images).
+                file_path = url.toLocalFile()
+                if os.path.splitext(file_path)[1].lower() in SUPPORTED_EXTENSIONS:
+                    self.image_dropped.emit(file_path)
         event.acceptProposedAction()
     
     def mousePressEvent(self, event):
@@ -1,51 +1,326 @@
+import functools
+import os
 import numpy as np
 from typing import List, Tuple, Dict
 from clip_service import CLIPService
 from cache_manager import CacheManager
+import search_kernels
+
+try:
+    import faiss  # optional, SIMD/OpenMP similarity search
+except ImportError:
+    faiss = None
+
+try:
+    import hnswlib  # optional, sublinear nearest-neighbor search
+except ImportError:
+    hnswlib = None
 
 
 class SearchEngine:
+    # Above this many vectors an exact flat scan starts to dominate
+    # query time; switch the FAISS backend to an IVF index (coarse
+    # quantizer + per-list scan, roughly O(nprobe * N / nlist)).
+    IVF_MIN_VECTORS = 50_000
+
     def __init__(self, cache_manager: CacheManager, clip_service: CLIPService):
         self.cache_manager = cache_manager
         self.clip_service = clip_service
+        self._index = None
+        self._index_paths: List[str] = []
+        self._index_version = 0
+        self._index_dirty = True
+        self._faiss_index = None
+        self._faiss_paths: List[str] = []
+        self._faiss_version = 0
+        # Lists probed per IVF query; raise for recall, lower for speed.
+        self.nprobe = 16
+        self._matrix_cache = None
+        # Per-instance LRU caches (a decorator on the method would pin
+        # self alive across model switches).
+        self._embed_text = functools.lru_cache(maxsize=512)(self._embed_text_uncached)
+        self._embed_image = functools.lru_cache(maxsize=64)(self._embed_image_uncached)
+        search_kernels.warmup()
+
+    def _embed_text_uncached(self, text: str) -> np.ndarray:
+        # Persistent cache first (survives restarts), then the encoder.
+        cached = self.cache_manager.get_text_embedding(text)
+        if cached is not None:
+            return cached
+        embedding = self.clip_service.get_text_embedding(text)
+        self.cache_manager.put_text_embedding(text, embedding)
+        return embedding
+
+    def _embed_image_uncached(self, image_path: str, mtime: float) -> np.ndarray:
+        # mtime participates in the key so edits invalidate the entry.
+        return self.clip_service.get_image_embedding(image_path)
+
+    def mark_index_dirty(self):
+        """Call after the embedding cache changes so the next search
+        refreshes (incrementally, when possible) the ANN index."""
+        self._index_dirty = True
+        self._matrix_cache = None
+
+    def _ensure_matrix(self):
+        """(paths, matrix) over the packed embedding store.
+
+        Every row is unit-length — CacheManager normalizes at save time
+        and when back-filling legacy files — so ranking needs no
+        per-query row norms, just the one matvec.
+        """
+        if self._matrix_cache is None:
+            paths, matrix = self.cache_manager.get_embedding_matrix()
+            if matrix is None:
+                self._matrix_cache = ([], None)
+            else:
+                # ndarray view over the memmap (zero-copy, C-contiguous
+                # float32) so per-query ranking does no conversion work.
+                self._matrix_cache = (paths, np.asarray(matrix, dtype=np.float32))
+        return self._matrix_cache
 
     def search(self, query: str, top_k: int = 20) -> List[Tuple[str, float]]:
-        text_embedding = self.clip_service.get_text_embedding(query)
-        
-        embeddings = self.cache_manager.get_all_embeddings()
-        
-        if not embeddings:
-            return []
-        
-        results = []
-        
-        for img_path, img_embedding in embeddings.items():
-            similarity = self._cosine_similarity(text_embedding, img_embedding)
-            results.append((img_path, similarity))
-        
-        results.sort(key=lambda x: x[1], reverse=True)
-        
-        return results[:top_k]
+        text_embedding = self._embed_text(query.strip())
+        return self._rank(text_embedding, top_k)
 
     def search_by_image(self, image_path: str, top_k: int = 20) -> List[Tuple[str, float]]:
-        image_embedding = self.clip_service.get_image_embedding(image_path)
-        
-        embeddings = self.cache_manager.get_all_embeddings()
-        
-        if not embeddings:
+        try:
+            mtime = os.path.getmtime(image_path)
+        except OSError:
+            mtime = -1.0
+        image_embedding = self._embed_image(image_path, mtime)
+        return self._rank(image_embedding, top_k)
+
+    def _index_files(self) -> Tuple[str, str]:
+        model_dir = self.cache_manager.model_cache_dir
+        return (os.path.join(model_dir, "hnsw.index"),
+                os.path.join(model_dir, "hnsw.ids"))
+
+    def _faiss_files(self) -> Tuple[str, str]:
+        model_dir = self.cache_manager.model_cache_dir
+        return (os.path.join(model_dir, "faiss.index"),
+                os.path.join(model_dir, "faiss.ids"))
+
+    def _persist_faiss(self):
+        # First line of the ids file is the packed-store version the
+        # index was built against; the paths follow.
+        index_file, ids_file = self._faiss_files()
+        try:
+            faiss.write_index(self._faiss_index, index_file)
+            with open(ids_file, 'w', encoding='utf-8') as f:
+                f.write(str(self._faiss_version) + "\n")
+                f.write("\n".join(self._faiss_paths) + "\n")
+        except OSError:
+            pass  # index persists next time; search still works
+
+    def _ensure_faiss(self):
+        """Build (or incrementally extend) the FAISS index. Returns
+        (paths, index); index is None when faiss is missing or the
+        cache is empty.
+
+        IndexFlatIP over unit-length rows gives exact cosine ranking:
+        the whole GEMV plus top-k heap runs as one SIMD/OpenMP C++ call.
+        """
+        if faiss is None:
+            return [], None
+        if self._faiss_index is not None and not self._index_dirty:
+            return self._faiss_paths, self._faiss_index
+
+        paths, matrix = self.cache_manager.get_embedding_matrix()
+        if matrix is None or not paths:
+            self._faiss_index = None
+            self._faiss_paths = []
+            self._index_dirty = False
+            return [], None
+
+        dim = matrix.shape[1]
+        version = self.cache_manager.store_version()
+        index_file, ids_file = self._faiss_files()
+
+        # Cold start: try the index persisted by a previous session.
+        if self._faiss_index is None and os.path.exists(index_file) and os.path.exists(ids_file):
+            try:
+                with open(ids_file, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+                saved_version = int(lines[0])
+                saved = lines[1:]
+                if saved == paths[:len(saved)]:
+                    self._faiss_index = faiss.read_index(index_file)
+                    self._faiss_paths = saved
+                    self._faiss_version = saved_version
+            except Exception:
+                self._faiss_index = None
+
+        # A flat index that has outgrown the exact-scan regime gets
+        # rebuilt as IVF rather than extended.
+        outgrown = (self._faiss_index is not None
+                    and not hasattr(self._faiss_index, 'nprobe')
+                    and len(paths) > self.IVF_MIN_VECTORS)
+
+        # An unchanged path prefix is not enough: a re-embedded image
+        # appends a replacement row without changing the path list, and
+        # extending would keep serving its stale vector. Pure appends
+        # move the store version by exactly one row per new path.
+        pure_append = (self._faiss_index is not None
+                       and paths[:len(self._faiss_paths)] == self._faiss_paths
+                       and version - self._faiss_version
+                       == (len(paths) - len(self._faiss_paths)) * dim * 4)
+
+        if not outgrown and pure_append:
+            # Only new vectors were appended: add just those.
+            start = len(self._faiss_paths)
+            if start < len(paths):
+                self._faiss_index.add(np.ascontiguousarray(matrix[start:], dtype=np.float32))
+                self._faiss_paths = paths
+                self._faiss_version = version
+                self._persist_faiss()
+        else:
+            rows = np.ascontiguousarray(matrix, dtype=np.float32)
+            if len(paths) > self.IVF_MIN_VECTORS:
+                # nlist ~ 4*sqrt(N), capped so training always has
+                # enough points per list.
+                nlist = min(4096, max(64, int(4 * len(paths) ** 0.5)))
+                index = faiss.index_factory(dim, f"IVF{nlist},Flat",
+                                            faiss.METRIC_INNER_PRODUCT)
+                index.train(rows)
+            else:
+                index = faiss.IndexFlatIP(dim)
+            index.add(rows)
+            self._faiss_index = index
+            self._faiss_paths = paths
+            self._faiss_version = version
+            self._persist_faiss()
+
+        if hasattr(self._faiss_index, 'nprobe'):
+            self._faiss_index.nprobe = self.nprobe
+        self._index_dirty = False
+        return self._faiss_paths, self._faiss_index
+
+    def _persist_index(self):
+        # First line of the ids file is the packed-store version the
+        # index was built against; the paths follow.
+        index_file, ids_file = self._index_files()
+        try:
+            self._index.save_index(index_file)
+            with open(ids_file, 'w', encoding='utf-8') as f:
+                f.write(str(self._index_version) + "\n")
+                f.write("\n".join(self._index_paths) + "\n")
+        except OSError:
+            pass  # index persists next time; search still works
+
+    def _ensure_index(self):
+        """Build (or incrementally extend) the HNSW index over the
+        cached embedding matrix. Returns (paths, index); index is None
+        when hnswlib is missing or the cache is empty."""
+        if hnswlib is None:
+            return [], None
+        if self._index is not None and not self._index_dirty:
+            return self._index_paths, self._index
+
+        paths, matrix = self.cache_manager.get_embedding_matrix()
+        if matrix is None or not paths:
+            self._index = None
+            self._index_paths = []
+            self._index_dirty = False
+            return [], None
+
+        dim = matrix.shape[1]
+        version = self.cache_manager.store_version()
+        index_file, ids_file = self._index_files()
+
+        # Cold start: try the index persisted by a previous session.
+        if self._index is None and os.path.exists(index_file) and os.path.exists(ids_file):
+            try:
+                with open(ids_file, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+                saved_version = int(lines[0])
+                saved = lines[1:]
+                if saved == paths[:len(saved)]:
+                    index = hnswlib.Index(space='cosine', dim=dim)
+                    index.load_index(index_file, max_elements=max(len(paths) * 2, 1024))
+                    self._index = index
+                    self._index_paths = saved
+                    self._index_version = saved_version
+            except Exception:
+                self._index = None
+
+        # See _ensure_faiss: an unchanged path prefix can still hide a
+        # re-embedded row, so extending is only safe when the store
+        # version moved by exactly one row per new path.
+        pure_append = (self._index is not None
+                       and paths[:len(self._index_paths)] == self._index_paths
+                       and version - self._index_version
+                       == (len(paths) - len(self._index_paths)) * dim * 4)
+
+        if pure_append:
+            # Only new vectors were appended: add just those.
+            start = len(self._index_paths)
+            if start < len(paths):
+                new_rows = np.asarray(matrix[start:], dtype=np.float32)
+                if self._index.get_current_count() + len(new_rows) > self._index.get_max_elements():
+                    self._index.resize_index(max(len(paths) * 2, 1024))
+                self._index.add_items(new_rows, np.arange(start, len(paths)))
+                self._index_paths = paths
+                self._index_version = version
+                self._persist_index()
+        else:
+            index = hnswlib.Index(space='cosine', dim=dim)
+            index.init_index(max_elements=max(len(paths) * 2, 1024),
+                             M=16, ef_construction=200)
+            index.add_items(np.asarray(matrix, dtype=np.float32),
+                            np.arange(len(paths)))
+            self._index = index
+            self._index_paths = paths
+            self._index_version = version
+            self._persist_index()
+
+        self._index.set_ef(64)
+        self._index_dirty = False
+        return self._index_paths, self._index
+
+    def _rank(self, query_embedding: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        paths, findex = self._ensure_faiss()
+        if findex is not None:
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q = q / (np.linalg.norm(q) + 1e-12)
+            k = min(top_k, findex.ntotal)
+            if k == 0:
+                return []
+            scores, labels = findex.search(q[np.newaxis, :], k)
+            return [(paths[i], float(s))
+                    for i, s in zip(labels[0], scores[0]) if i >= 0]
+
+        paths, index = self._ensure_index()
+
+        if index is not None:
+            q = np.asarray(query_embedding, dtype=np.float32)
+            q = q / (np.linalg.norm(q) + 1e-12)
+            k = min(top_k, index.get_current_count())
+            if k == 0:
+                return []
+            labels, distances = index.knn_query(q[np.newaxis, :], k=k)
+            return [(paths[i], float(1.0 - d))
+                    for i, d in zip(labels[0], distances[0])]
+
+        # Brute-force fallback when hnswlib is not installed: one BLAS
+        # matvec over the packed (N, D) matrix instead of a Python loop
+        # of per-vector dot products.
+        paths, matrix = self._ensure_matrix()
+        if matrix is None:
             return []
-        
-        results = []
-        
-        for img_path, img_embedding in embeddings.items():
-            similarity = self._cosine_similarity(image_embedding, img_embedding)
-            results.append((img_path, similarity))
-        
-        results.sort(key=lambda x: x[1], reverse=True)
-        
-        return results[:top_k]
-
-    def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
-        a = a / np.linalg.norm(a)
-        b = b / np.linalg.norm(b)
-        return float(np.dot(a, b))
+
+        q = np.asarray(query_embedding, dtype=np.float32)
+        q = q / (np.linalg.norm(q) + 1e-12)
+        if search_kernels.dot_scores is not None:
+            scores = np.empty(len(paths), dtype=np.float32)
+            search_kernels.dot_scores(matrix, q, scores)
+        else:
+            scores = matrix @ q
+
+        # Partition out the top k in O(N), then sort only those k.
+        k = min(top_k, len(scores))
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        order = top[np.argsort(-scores[top])]
+        return [(paths[i], float(scores[i])) for i in order]
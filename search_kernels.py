@@ -0,0 +1,33 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def dot_scores(matrix, q, out):
+        # Rows are unit-length (normalized at save time), so cosine
+        # similarity is a plain dot product. The explicit loop lets
+        # numba emit SIMD + parallel code without the temporaries a
+        # numpy expression would allocate.
+        n, d = matrix.shape
+        for i in numba.prange(n):
+            s = 0.0
+            for j in range(d):
+                s += matrix[i, j] * q[j]
+            out[i] = s
+
+    def warmup():
+        """Compile the kernel on a tiny input so the first real query
+        does not pay the JIT cost (cache=True persists it afterwards)."""
+        m = np.zeros((2, 4), dtype=np.float32)
+        q = np.zeros(4, dtype=np.float32)
+        dot_scores(m, q, np.empty(2, dtype=np.float32))
+else:
+    dot_scores = None
+
+    def warmup():
+        pass